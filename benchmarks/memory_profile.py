@@ -0,0 +1,196 @@
+"""Memory profile of SteamPlugin on synthetic large library.
+
+Drives the plugin through owned games, game times, achievements and friends with backend responses generated
+in memory, takes tracemalloc snapshot after each stage and prints top allocators in plugin sources.
+Tracing is restarted for every stage, so reported memory is what the stage allocated on top of earlier stages.
+Exits with non-zero status when peak memory of any stage exceeds its budget.
+
+    python benchmarks/memory_profile.py --games 10000 --friends 2000 --budget achievements=200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from backend import SteamHttpClient  # noqa: E402
+from plugin import SteamPlugin  # noqa: E402
+from snapshot import SnapshotStore  # noqa: E402
+
+STEAM_ID = "76561198000000000"
+STAGES = ("owned_games", "game_times", "achievements", "friends")
+TRACKED_FILES = (
+    "backend.py", "plugin.py", "cache.py", "snapshot.py", "response_cache.py", "circuit_breaker.py"
+)
+TRACEBACK_LIMIT = 25
+DEFAULT_BUDGETS_MB = {
+    "owned_games": 64,
+    "game_times": 64,
+    "achievements": 256,
+    "friends": 64
+}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self._text = text
+
+    async def text(self, *args, **kwargs):
+        return self._text
+
+
+class FakeHttpClient:
+    """Serves synthetic steamcommunity.com pages"""
+
+    def __init__(self, games, friends, achievements_per_game):
+        self._games = games
+        self._friends = friends
+        self._achievements_per_game = achievements_per_game
+
+    async def get(self, url, *args, **kwargs):
+        if url.endswith("/games/?tab=all"):
+            return FakeResponse(self._games_page())
+        if "/stats/" in url:
+            return FakeResponse(self._achievements_page())
+        if url.endswith("/friends/"):
+            return FakeResponse(self._friends_page())
+        raise ValueError("Unexpected url {}".format(url))
+
+    def _games_page(self):
+        games = [
+            {
+                "appid": 10 + i,
+                "name": "Synthetic game {}".format(i),
+                "hours_forever": "{}.5".format(i % 1000),
+                "last_played": 1550000000 + i
+            }
+            for i in range(self._games)
+        ]
+        return "<script>var rgGames = {};\r\n</script>".format(json.dumps(games))
+
+    def _achievements_page(self):
+        rows = "".join(
+            '<div class="achieveRow"><div class="achieveUnlockTime">Unlocked 5 Mar, 2019 @ 3:12pm</div>'
+            "<h3>Achievement {}</h3></div>".format(i)
+            for i in range(self._achievements_per_game)
+        )
+        return "<html><body>{}</body></html>".format(rows)
+
+    def _friends_page(self):
+        blocks = "".join(
+            '<div class="friend_block_v2" data-steamid="{}"><div class="friend_block_content">'
+            "Friend {}<br>Last Online 3 days ago</div></div>".format(76561198100000000 + i, i)
+            for i in range(self._friends)
+        )
+        return '<div id="search_results">{}</div>'.format(blocks)
+
+
+class NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def top_allocators(snapshot, limit):
+    """Group traced memory by the innermost line in TRACKED_FILES of each allocation"""
+    lines = {}
+    for trace in snapshot.traces:
+        for frame in trace.traceback:
+            if os.path.basename(frame.filename) in TRACKED_FILES:
+                key = (os.path.basename(frame.filename), frame.lineno)
+                size, count = lines.get(key, (0, 0))
+                lines[key] = (size + trace.size, count + 1)
+                break
+    return sorted(lines.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+
+
+async def run_stage(name, stage, limit):
+    # tracemalloc.reset_peak is not available before Python 3.9, restart tracing instead
+    tracemalloc.stop()
+    tracemalloc.start(TRACEBACK_LIMIT)
+    try:
+        await stage()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    print("== {}: current {:.1f} MB, peak {:.1f} MB".format(name, current / 2 ** 20, peak / 2 ** 20))
+    for (filename, lineno), (size, count) in top_allocators(snapshot, limit):
+        print("   {:>10.1f} KB {:>8} blocks  {}:{}".format(size / 2 ** 10, count, filename, lineno))
+    return peak
+
+
+async def profile(args):
+    plugin = SteamPlugin(None, NullWriter(), None)
+    plugin._steam_id = STEAM_ID
+    plugin._client = SteamHttpClient(FakeHttpClient(args.games, args.friends, args.achievements_per_game))
+
+    peaks = {}
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        plugin._snapshot_store = SnapshotStore(snapshot_dir)
+        try:
+            game_ids = [str(10 + i) for i in range(args.games)]
+            stages = {
+                "owned_games": plugin.get_owned_games,
+                "game_times": lambda: plugin.import_game_times(game_ids),
+                "achievements": lambda: plugin.import_games_achievements(game_ids[:args.achievement_games]),
+                "friends": plugin.get_friends
+            }
+            for name in STAGES:
+                peaks[name] = await run_stage(name, stages[name], args.top)
+        finally:
+            await plugin._http_client.close()
+    return peaks
+
+
+def parse_budgets(parser, values):
+    budgets = dict(DEFAULT_BUDGETS_MB)
+    for value in values:
+        stage, _, megabytes = value.partition("=")
+        if stage not in budgets:
+            parser.error("unknown stage {}".format(stage))
+        try:
+            budgets[stage] = float(megabytes)
+        except ValueError:
+            parser.error("invalid budget {}".format(value))
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--achievement-games", type=int, default=500, help="games to import achievements for")
+    parser.add_argument("--achievements-per-game", type=int, default=50)
+    parser.add_argument("--friends", type=int, default=2000)
+    parser.add_argument("--top", type=int, default=10, help="allocators reported per stage")
+    parser.add_argument(
+        "--budget", action="append", default=[], metavar="STAGE=MB",
+        help="peak memory budget of a stage, one of: {}".format(", ".join(STAGES))
+    )
+    args = parser.parse_args()
+    budgets = parse_budgets(parser, args.budget)
+
+    peaks = asyncio.run(profile(args))
+
+    over_budget = [
+        "{}: peak {:.1f} MB > budget {:.1f} MB".format(stage, peak / 2 ** 20, budgets[stage])
+        for stage, peak in peaks.items()
+        if peak > budgets[stage] * 2 ** 20
+    ]
+    for line in over_budget:
+        print("OVER BUDGET " + line)
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Import time with cold and warm on-disk response cache.
+
+Imports friends and achievements through SteamHttpClient backed by synthetic pages served with artificial
+latency, then repeats the import with a fresh client (as after plugin restart) sharing the same cache directory.
+
+    python benchmarks/warm_start.py --games 200 --latency 0.1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from backend import SteamHttpClient  # noqa: E402
+from response_cache import DiskResponseCache  # noqa: E402
+from memory_profile import FakeHttpClient, STEAM_ID  # noqa: E402
+
+
+class SlowHttpClient(FakeHttpClient):
+    def __init__(self, latency, *args):
+        super().__init__(*args)
+        self._latency = latency
+        self.requests = 0
+
+    async def get(self, url, *args, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(self._latency)
+        return await super().get(url, *args, **kwargs)
+
+
+async def run_import(args, cache_dir):
+    http_client = SlowHttpClient(args.latency, 0, args.friends, args.achievements_per_game)
+    client = SteamHttpClient(http_client, response_cache=DiskResponseCache(cache_dir))
+
+    start = time.perf_counter()
+    await client.get_friends(STEAM_ID, use_cache=True)
+    # games last played before the cold run, so cached pages are fresh enough
+    await asyncio.gather(*[client.get_achievements(STEAM_ID, 10 + i, not_before=0) for i in range(args.games)])
+    return time.perf_counter() - start, http_client.requests
+
+
+async def benchmark(args):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name in ("cold", "warm"):
+            elapsed, requests = await run_import(args, cache_dir)
+            print("{}: {:.2f}s, {} backend requests".format(name, elapsed, requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=200, help="games to import achievements for")
+    parser.add_argument("--achievements-per-game", type=int, default=50)
+    parser.add_argument("--friends", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.1, help="simulated backend latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
 import asyncio
+import functools
 import json
 import logging
+from collections import OrderedDict
 from datetime import datetime, timezone
 
 import aiohttp
 from yarl import URL
 from requests_html import HTML
-from galaxy.api.errors import AuthenticationRequired, UnknownBackendResponse, AccessDenied
-from galaxy.http import HttpClient
+from galaxy.api.errors import (
+    AuthenticationRequired, UnknownBackendResponse, AccessDenied, BackendNotAvailable, BackendTimeout, BackendError,
+    NetworkError, TooManyRequests, UnknownError
+)
+
+from circuit_breaker import CircuitBreaker
+from http_policy import RetryPolicy, RetryBudget, DeadlineExceeded, RequestNotSent, remaining_time
+from transport import TransportConfig, TransportStats, RequestProgress, create_session
+
+# transport and server errors, also the only ones counted against backend health by circuit breakers
+RETRYABLE_ERRORS = (BackendNotAvailable, BackendTimeout, BackendError, NetworkError)
+# timeouts caused by the plugin itself, not by backend
+LOCAL_TIMEOUT_ERRORS = (DeadlineExceeded, RequestNotSent)
+
+ENDPOINT_FAMILIES = ("games", "stats", "friends", "profile")
+# profile is used to validate credentials, stale result would authenticate without checking them
+NO_STALE_FAMILIES = ("profile",)
+STALE_RESULTS_LIMIT = 64
 
 class CookieJar(aiohttp.CookieJar):
     def __init__(self):
@@ -23,11 +41,28 @@ class CookieJar(aiohttp.CookieJar):
             self._cookies_updated_callback(list(self))
 
 
-class AuthenticatedHttpClient(HttpClient):
-    def __init__(self):
+class AuthenticatedHttpClient:
+    """Session with tuned transport, errors are translated the same way galaxy.http.HttpClient does it"""
+
+    def __init__(self, retry_policy=None, transport_config=None):
         self._auth_lost_callback = None
         self._cookie_jar = CookieJar()
-        super().__init__(cookie_jar=self._cookie_jar)
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._retry_budget = RetryBudget(self._retry_policy.retry_budget_ratio, self._retry_policy.retry_budget_max)
+        self._transport_stats = TransportStats()
+        self._transport_config = transport_config or TransportConfig()
+        self._session = create_session(self._transport_config, self._transport_stats, cookie_jar=self._cookie_jar)
+
+    @property
+    def transport_stats(self):
+        return self._transport_stats
+
+    @property
+    def connection_limit_per_host(self):
+        return self._transport_config.limit_per_host
+
+    async def close(self):
+        await self._session.close()
 
     def set_auth_lost_callback(self, callback):
         self._auth_lost_callback = callback
@@ -40,7 +75,7 @@ class AuthenticatedHttpClient(HttpClient):
 
     async def get(self, *args, **kwargs):
         try:
-            response = await super().request("GET", *args, **kwargs)
+            response = await self._request_with_retries("GET", *args, **kwargs)
         except AuthenticationRequired:
             self._auth_lost()
 
@@ -51,16 +86,204 @@ class AuthenticatedHttpClient(HttpClient):
 
         return response
 
+    def _request_timeout(self):
+        timeout = self._retry_policy.request_timeout
+        remaining = remaining_time()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            logging.warning("Import deadline passed, not sending request")
+            raise DeadlineExceeded()
+        return min(timeout, remaining)
+
+    async def _request_with_retries(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            timeout = self._request_timeout()
+            progress = RequestProgress()
+            try:
+                response = await asyncio.wait_for(
+                    self._hedged_request(method, url, *args, trace_request_ctx=progress, **kwargs), timeout
+                )
+            except asyncio.TimeoutError:
+                # neither says anything about backend and retry would not help
+                if timeout < self._retry_policy.request_timeout:
+                    logging.warning("Request %s %s cut by import deadline after %.1fs", method, url, timeout)
+                    raise DeadlineExceeded()
+                if not progress.connected:
+                    logging.warning("Request %s %s got no connection in %.1fs", method, url, timeout)
+                    raise RequestNotSent()
+                logging.warning("Request %s %s timed out after %.1fs", method, url, timeout)
+                error = BackendTimeout()
+            except RETRYABLE_ERRORS as e:
+                error = e
+            else:
+                self._retry_budget.deposit()
+                return response
+
+            attempt += 1
+            if attempt > self._retry_policy.max_retries:
+                logging.warning("Giving up on %s %s after %d attempts: %r", method, url, attempt, error)
+                raise error
+            delay = self._retry_policy.backoff(attempt)
+            remaining = remaining_time()
+            if remaining is not None and delay >= remaining:
+                logging.warning("Not retrying %s %s, deadline too close: %r", method, url, error)
+                raise error
+            if not self._retry_budget.withdraw():
+                logging.warning("Retry budget exhausted, not retrying %s %s: %r", method, url, error)
+                raise error
+            logging.info(
+                "Retrying %s %s in %.2fs (attempt %d/%d): %r",
+                method, url, delay, attempt, self._retry_policy.max_retries, error
+            )
+            await asyncio.sleep(delay)
+
+    async def _hedged_request(self, method, url, *args, **kwargs):
+        tasks = [asyncio.ensure_future(self._request_attempt(method, url, *args, **kwargs))]
+        try:
+            hedge_delay = self._retry_policy.hedge_delay
+            if hedge_delay is None:
+                return await tasks[0]
+
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                if self._retry_budget.withdraw():
+                    logging.info("Request %s %s slower than %.2fs, sending hedged request", method, url, hedge_delay)
+                    tasks.append(asyncio.ensure_future(self._request_attempt(method, url, *args, **kwargs)))
+                else:
+                    logging.debug("Retry budget exhausted, not hedging %s %s", method, url)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # every attempt failed, report the first one
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _request_attempt(self, method, *args, **kwargs):
+        try:
+            response = await self._session.request(method, *args, **kwargs)
+            # read body as part of the attempt so slow transfers are covered by the timeout
+            await response.read()
+        except asyncio.TimeoutError:
+            raise BackendTimeout()
+        except aiohttp.ServerDisconnectedError:
+            raise BackendNotAvailable()
+        except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError):
+            raise NetworkError()
+        except aiohttp.ContentTypeError:
+            raise UnknownBackendResponse()
+        except aiohttp.ClientError:
+            logging.exception("Caught exception while performing request")
+            raise UnknownError()
+
+        if response.status == 401:
+            raise AuthenticationRequired()
+        if response.status == 403:
+            raise AccessDenied()
+        if response.status == 429:
+            raise TooManyRequests()
+        if response.status == 503:
+            raise BackendNotAvailable()
+        if response.status >= 500:
+            raise BackendError()
+        if response.status >= 400:
+            logging.warning("Got status %d while performing %s request for %s", response.status, method, args[0])
+            raise UnknownError()
+        return response
+
     def _auth_lost(self):
         if self._auth_lost_callback:
             self._auth_lost_callback()
         raise AccessDenied()
 
 
+def endpoint(family):
+    """Guard SteamHttpClient method with circuit breaker of given endpoint family"""
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            return await self._call_endpoint(
+                family, (method.__name__,) + args, lambda: method(self, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
 class SteamHttpClient:
-    def __init__(self, http_client):
+    def __init__(self, http_client, circuit_breakers=None, response_cache=None):
         self._http_client = http_client
+        self._response_cache = response_cache
+        self._circuit_breakers = circuit_breakers or {family: CircuitBreaker(family) for family in ENDPOINT_FAMILIES}
+        # last good results of recent calls (LRU), served when circuit is open
+        self._stale_results = OrderedDict()
+
+    async def _call_endpoint(self, family, key, call):
+        breaker = self._circuit_breakers[family]
+        if not breaker.allow_request():
+            result = self._stale_results.get(key)
+            if result is None:
+                logging.info("Circuit %s open, failing fast on %s", family, key[0])
+                raise BackendNotAvailable()
+            logging.info("Circuit %s open, serving stale result of %s", family, key[0])
+            return result
 
+        try:
+            result = await call()
+        except LOCAL_TIMEOUT_ERRORS:
+            breaker.release()
+            raise
+        except RETRYABLE_ERRORS:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # auth and parse errors say nothing about backend health
+            breaker.release()
+            raise
+
+        breaker.record_success()
+        if family not in NO_STALE_FAMILIES:
+            self._stale_results[key] = result
+            self._stale_results.move_to_end(key)
+            while len(self._stale_results) > STALE_RESULTS_LIMIT:
+                self._stale_results.popitem(last=False)
+        return result
+
+    async def _get_and_parse(self, family, key, steam_id, url, params, parse, use_cache, not_before=None):
+        """GET page and parse its text in executor.
+
+        Fetched pages are always stored in optional on-disk response cache, but they are read from it only when
+        `use_cache` is set, to seed data after plugin start. Callers needing fresh data must not set it.
+        Cache is looked up before circuit breaker of `family`, so cache hits do not affect backend health.
+        """
+        loop = asyncio.get_running_loop()
+        if self._response_cache is not None and use_cache:
+            text = await loop.run_in_executor(
+                None, self._response_cache.get, steam_id, url, params, not_before
+            )
+            if text is not None:
+                return await loop.run_in_executor(None, parse, text)
+
+        async def fetch():
+            response = await self._http_client.get(url, params=params)
+            text = await response.text(encoding="utf-8", errors="replace")
+            result = await loop.run_in_executor(None, parse, text)
+
+            # store only responses that parsed fine
+            if self._response_cache is not None:
+                await loop.run_in_executor(None, self._response_cache.put, steam_id, url, params, text)
+            return result
+
+        return await self._call_endpoint(family, key, fetch)
+
+    @endpoint("profile")
     async def get_profile(self):
         url = "https://steamcommunity.com/"
         response = await self._http_client.get(url, allow_redirects=True)
@@ -79,6 +302,7 @@ class SteamHttpClient:
         loop = asyncio.get_running_loop()
         return await loop.run_in_executor(None, parse, text)
 
+    @endpoint("profile")
     async def get_profile_data(self, url):
         response = await self._http_client.get(url, allow_redirects=True)
         text = await response.text()
@@ -105,6 +329,7 @@ class SteamHttpClient:
         loop = asyncio.get_running_loop()
         return await loop.run_in_executor(None, parse, text)
 
+    @endpoint("games")
     async def get_games(self, steam_id):
         url = "https://steamcommunity.com/profiles/{}/games/?tab=all".format(steam_id)
         response = await self._http_client.get(url)
@@ -142,14 +367,13 @@ class SteamHttpClient:
                 logging.exception("Unexpected date format: {}. Please report to the developers".format(text_time))
                 raise UnknownBackendResponse()
 
-    async def get_achievements(self, steam_id, game_id):
+    async def get_achievements(self, steam_id, game_id, not_before=None):
+        """Cached page is accepted only if stored after `not_before` (eg. last played time)"""
         url = "https://steamcommunity.com/profiles/{}/stats/{}/".format(steam_id, game_id)
         params = {
             "tab": "achievements",
             "l": "english"
         }
-        response = await self._http_client.get(url, params=params)
-        text = await response.text()
 
         def parse(text):
             html = HTML(html=text)
@@ -169,15 +393,15 @@ class SteamHttpClient:
 
             return achievements
 
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, parse, text)
-
-    async def get_friends(self, steam_id):
-        response = await self._http_client.get(
-            "https://steamcommunity.com/profiles/{}/friends/".format(steam_id),
-            params={"l": "english", "ajax": 1}
+        return await self._get_and_parse(
+            "stats", ("get_achievements", steam_id, game_id), steam_id, url, params, parse,
+            use_cache=not_before is not None, not_before=not_before
         )
 
+    async def get_friends(self, steam_id, use_cache=False):
+        url = "https://steamcommunity.com/profiles/{}/friends/".format(steam_id)
+        params = {"l": "english", "ajax": 1}
+
         def parse_response(text):
             def parse_id(profile):
                 return profile.attrs["data-steamid"]
@@ -195,5 +419,6 @@ class SteamHttpClient:
                 logging.exception("Can not parse backend response")
                 raise UnknownBackendResponse()
 
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, parse_response, await response.text(encoding="utf-8", errors="replace"))
+        return await self._get_and_parse(
+            "friends", ("get_friends", steam_id), steam_id, url, params, parse_response, use_cache
+        )
@@ -18,6 +18,9 @@ class Cache:
             return None
         return entry.value
 
+    def __contains__(self, key):
+        return key in self._entries
+
     def update(self, key, value, timestamp):
         entry = self._entries.get(key)
         if entry is None:
@@ -0,0 +1,82 @@
+import enum
+import logging
+import time
+from collections import deque
+
+
+class CircuitState(enum.Enum):
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self, name, failure_threshold=0.5, window_size=20, min_requests=5, open_duration=30, half_open_requests=1
+    ):
+        self._name = name
+        self._failure_threshold = failure_threshold
+        self._min_requests = min_requests
+        self._open_duration = open_duration
+        self._half_open_requests = half_open_requests
+        self._results = deque(maxlen=window_size)
+        self._state = CircuitState.Closed
+        self._opened_at = 0
+        self._probes_in_flight = 0
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        if self._state == CircuitState.Open:
+            if time.monotonic() - self._opened_at < self._open_duration:
+                return False
+            logging.info("Circuit %s half-open, probing backend", self._name)
+            self._state = CircuitState.HalfOpen
+            self._probes_in_flight = 0
+
+        if self._state == CircuitState.HalfOpen:
+            if self._probes_in_flight >= self._half_open_requests:
+                return False
+            self._probes_in_flight += 1
+
+        return True
+
+    def record_success(self):
+        if self._state == CircuitState.HalfOpen:
+            logging.info("Circuit %s closed, backend recovered", self._name)
+            self._state = CircuitState.Closed
+            self._results.clear()
+            self._probes_in_flight = 0
+            return
+        self._results.append(True)
+
+    def record_failure(self):
+        if self._state == CircuitState.HalfOpen:
+            self._open()
+            return
+        if self._state == CircuitState.Open:
+            return
+        self._results.append(False)
+        if len(self._results) < self._min_requests:
+            return
+        failure_rate = self._results.count(False) / len(self._results)
+        if failure_rate >= self._failure_threshold:
+            self._open()
+
+    def release(self):
+        """Request finished without telling anything about backend health (eg. cancelled)"""
+        if self._state == CircuitState.HalfOpen and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def _open(self):
+        logging.warning("Circuit %s open for %ss, failing fast", self._name, self._open_duration)
+        self._state = CircuitState.Open
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self._probes_in_flight = 0
@@ -0,0 +1,76 @@
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from galaxy.api.errors import BackendTimeout
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(timeout):
+    """Limit all requests made in this context (and tasks spawned from it) to `timeout` seconds"""
+    new_deadline = time.monotonic() + timeout
+    current_deadline = _deadline.get()
+    if current_deadline is not None:
+        new_deadline = min(new_deadline, current_deadline)
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    current_deadline = _deadline.get()
+    if current_deadline is None:
+        return None
+    return current_deadline - time.monotonic()
+
+
+class DeadlineExceeded(BackendTimeout):
+    """Import deadline passed before the request could finish"""
+
+
+class RequestNotSent(BackendTimeout):
+    """Request timed out waiting for a free connection, before reaching backend"""
+
+
+@dataclass
+class RetryPolicy:
+    request_timeout: float = 30
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_cap: float = 5
+    # fraction of a retry earned by every successful request
+    retry_budget_ratio: float = 0.2
+    retry_budget_max: float = 10
+    # start a duplicate request if the first one is not done after this many seconds, None disables hedging
+    hedge_delay: Optional[float] = None
+
+    def backoff(self, attempt):
+        # "full jitter" exponential backoff
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+
+class RetryBudget:
+    def __init__(self, ratio, max_tokens):
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+    def deposit(self):
+        self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self):
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import os
 import platform
 import random
 import re
@@ -22,6 +23,10 @@ from registry_monitor import get_steam_registry_monitor
 from uri_scheme_handler import is_uri_handler_installed
 from version import __version__
 from cache import Cache
+from http_policy import deadline
+from snapshot import SnapshotStore, default_snapshot_directory
+from scheduler import CoalescingScheduler
+from response_cache import DiskResponseCache
 
 def is_windows():
     return platform.system().lower() == "windows"
@@ -31,6 +36,14 @@ LOGIN_URI = r"https://steamcommunity.com/login/home/?goto="
 JS_PERSISTENT_LOGIN = r"document.getElementById('remember_login').checked = true;"
 END_URI_REGEX = r"^https://steamcommunity.com/(profiles|id)/.*"
 
+# upper bound (in seconds) for all backend requests made by a single import call
+IMPORT_DEADLINE = 300
+
+# on-disk cache of friends and stats pages, shared by plugin processes; disabled unless directory is set
+RESPONSE_CACHE_DIR = os.environ.get("STEAM_PLUGIN_RESPONSE_CACHE_DIR")
+RESPONSE_CACHE_MAX_AGE = 3600
+RESPONSE_CACHE_MAX_SIZE = 64 * 2 ** 20
+
 AUTH_PARAMS = {
     "window_title": "Login to Steam",
     "window_width": 640,
@@ -74,9 +87,20 @@ class SteamPlugin(Plugin):
         self._steam_id = None
         self._regmon = get_steam_registry_monitor()
         self._local_games_cache = local_games_list()
+        # galaxy calls tick every second, debounce has to be longer to merge registry changes
+        self._local_games_scheduler = CoalescingScheduler(
+            "local games", self._scan_local_games, self._update_local_games, debounce=2.5, max_wait=10
+        )
         self._http_client = AuthenticatedHttpClient()
-        self._client = SteamHttpClient(self._http_client)
+        response_cache = None
+        if RESPONSE_CACHE_DIR:
+            response_cache = DiskResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_AGE, RESPONSE_CACHE_MAX_SIZE)
+        self._client = SteamHttpClient(self._http_client, response_cache=response_cache)
         self._achievements_cache = Cache()
+        self._snapshot_store = SnapshotStore(default_snapshot_directory())
+        self._snapshot = None
+        self._snapshot_save_lock = asyncio.Lock()
+        self._revalidation_tasks = {}
 
     def _store_cookies(self, cookies):
         credentials = {
@@ -95,10 +119,16 @@ class SteamPlugin(Plugin):
         )
 
     def shutdown(self):
+        self._cancel_revalidation()
+        self._local_games_scheduler.close()
         asyncio.create_task(self._http_client.close())
         self._regmon.close()
 
     async def _do_auth(self, morsels):
+        # refreshes of previous account must not touch state of the new one
+        tasks = self._cancel_revalidation()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
         cookies = [(morsel.key, morsel) for morsel in morsels]
 
         self._http_client.update_cookies(cookies)
@@ -115,6 +145,9 @@ class SteamPlugin(Plugin):
         except AccessDenied:
             raise InvalidCredentials()
 
+        # snapshot is scoped to steam id
+        self._snapshot = None
+
         self._http_client.set_auth_lost_callback(self.lost_authentication)
 
         return Authentication(self._steam_id, login)
@@ -155,26 +188,46 @@ class SteamPlugin(Plugin):
         if self._steam_id is None:
             raise AuthenticationRequired()
 
+        snapshot = await self._get_snapshot()
+        owned_games = snapshot.get("owned_games")
+        if owned_games is None:
+            owned_games = await self._get_owned_games_dict()
+            await self._update_snapshot("owned_games", owned_games)
+        else:
+            self._revalidate("owned_games", self._refresh_owned_games)
+
+        return [self._create_game(game_id, name) for game_id, name in owned_games.items()]
+
+    @staticmethod
+    def _create_game(game_id, name):
+        return Game(game_id, name, [], LicenseInfo(LicenseType.SinglePurchase, None))
+
+    async def _get_owned_games_dict(self) -> Dict[str, str]:
         games = await self._client.get_games(self._steam_id)
 
-        owned_games = []
+        owned_games = {}
 
         try:
             for game in games:
-                owned_games.append(
-                    Game(
-                        str(game["appid"]),
-                        game["name"],
-                        [],
-                        LicenseInfo(LicenseType.SinglePurchase, None)
-                    )
-                )
+                owned_games[str(game["appid"])] = game["name"]
         except (KeyError, ValueError):
             logging.exception("Can not parse backend response")
             raise UnknownBackendResponse()
 
         return owned_games
 
+    async def _refresh_owned_games(self):
+        new_games = await self._get_owned_games_dict()
+        old_games = (await self._get_snapshot()).get("owned_games", {})
+        for game_id in old_games.keys() - new_games.keys():
+            self.remove_game(game_id)
+        for game_id in new_games.keys() - old_games.keys():
+            self.add_game(self._create_game(game_id, new_games[game_id]))
+        for game_id in new_games.keys() & old_games.keys():
+            if new_games[game_id] != old_games[game_id]:
+                self.update_game(self._create_game(game_id, new_games[game_id]))
+        await self._update_snapshot("owned_games", new_games)
+
     async def get_game_times(self):
         """"Left for automatic feature detection"""
         if self._steam_id is None:
@@ -189,6 +242,10 @@ class SteamPlugin(Plugin):
         await super().start_game_times_import(game_ids)
 
     async def import_game_times(self, game_ids):
+        with deadline(IMPORT_DEADLINE), self._http_client.transport_stats.report("Game times import"):
+            await self._import_game_times(game_ids)
+
+    async def _import_game_times(self, game_ids):
         remaining_game_ids = set(game_ids)
         try:
             game_times = await self._get_game_times_dict()
@@ -206,7 +263,10 @@ class SteamPlugin(Plugin):
 
     async def _get_game_times_dict(self) -> Dict[str, GameTime]:
         games = await self._client.get_games(self._steam_id)
+        return self._parse_game_times(games)
 
+    @staticmethod
+    def _parse_game_times(games) -> Dict[str, GameTime]:
         game_times = {}
 
         try:
@@ -239,10 +299,18 @@ class SteamPlugin(Plugin):
         await super().start_achievements_import(game_ids)
 
     async def import_games_achievements(self, game_ids):
+        with deadline(IMPORT_DEADLINE), self._http_client.transport_stats.report("Achievements import"):
+            await self._import_games_achievements(game_ids)
+
+    async def _import_games_achievements(self, game_ids):
         remaining_game_ids = set(game_ids)
         try:
-            game_times = await self._get_game_times_dict()
+            games = await self._client.get_games(self._steam_id)
+            game_times = self._parse_game_times(games)
+            games_with_achievements = self._parse_games_with_achievements(games)
 
+            # request timeout covers waiting for pooled connection, so do not queue more requests than it has
+            semaphore = asyncio.Semaphore(self._http_client.connection_limit_per_host)
             tasks = []
             for game_id in game_ids:
                 game_time = game_times.get(game_id)
@@ -251,6 +319,11 @@ class SteamPlugin(Plugin):
                     self.game_achievements_import_success(game_id, [])
                     continue
 
+                if game_id not in games_with_achievements:
+                    # game has no achievements at all, no need to look at stats page
+                    self.game_achievements_import_success(game_id, [])
+                    continue
+
                 timestamp = game_time.last_played_time
                 achievements = self._achievements_cache.get(game_id, timestamp)
 
@@ -260,7 +333,7 @@ class SteamPlugin(Plugin):
                     continue
 
                 # fetch from backend and update cache
-                tasks.append(asyncio.create_task(self._import_game_achievements(game_id, timestamp)))
+                tasks.append(asyncio.create_task(self._import_game_achievements(game_id, timestamp, semaphore)))
 
             await asyncio.gather(*tasks)
         except Exception as error:
@@ -268,40 +341,116 @@ class SteamPlugin(Plugin):
             for game_id in remaining_game_ids:
                 self.game_achievements_import_failure(game_id, error)
 
-    async def _import_game_achievements(self, game_id, timestamp):
+    @staticmethod
+    def _parse_games_with_achievements(games):
+        try:
+            return {
+                str(game["appid"])
+                for game in games
+                # assume achievements if stat links are missing
+                if game.get("availStatLinks", {}).get("achievements", True)
+            }
+        except (KeyError, AttributeError):
+            logging.exception("Can not parse backend response")
+            raise UnknownBackendResponse()
+
+    async def _import_game_achievements(self, game_id, timestamp, semaphore):
         """For fetching single game achievements"""
         try:
-            achievements = await self._get_achievements(game_id)
+            # on-disk response cache may only seed games not fetched yet, never serve invalidated entry
+            not_before = None if game_id in self._achievements_cache else timestamp
+            async with semaphore:
+                achievements = await self._get_achievements(game_id, not_before=not_before)
             self.game_achievements_import_success(game_id, achievements)
             self._achievements_cache.update(game_id, achievements, timestamp)
         except Exception as error:
             self.game_achievements_import_failure(game_id, error)
 
-    async def _get_achievements(self, game_id):
-        achievements = await self._client.get_achievements(self._steam_id, game_id)
+    async def _get_achievements(self, game_id, not_before=None):
+        achievements = await self._client.get_achievements(self._steam_id, game_id, not_before=not_before)
         return [Achievement(unlock_time, None, name) for unlock_time, name in achievements]
 
     async def get_friends(self):
         if self._steam_id is None:
             raise AuthenticationRequired()
 
-        return [
-            FriendInfo(user_id=user_id, user_name=user_name)
-            for user_id, user_name in (await self._client.get_friends(self._steam_id)).items()
-        ]
+        snapshot = await self._get_snapshot()
+        friends = snapshot.get("friends")
+        if friends is None:
+            # no snapshot yet, response cache of other process may seed it
+            friends = await self._client.get_friends(self._steam_id, use_cache=True)
+            await self._update_snapshot("friends", friends)
+        else:
+            self._revalidate("friends", self._refresh_friends)
+
+        return [FriendInfo(user_id=user_id, user_name=user_name) for user_id, user_name in friends.items()]
+
+    async def _refresh_friends(self):
+        new_friends = await self._client.get_friends(self._steam_id)
+        old_friends = (await self._get_snapshot()).get("friends", {})
+        for user_id in old_friends.keys() - new_friends.keys():
+            self.remove_friend(user_id)
+        for user_id in new_friends.keys() - old_friends.keys():
+            self.add_friend(FriendInfo(user_id=user_id, user_name=new_friends[user_id]))
+        for user_id in new_friends.keys() & old_friends.keys():
+            if new_friends[user_id] != old_friends[user_id]:
+                # there is no update notification for friends, re-add renamed one
+                self.remove_friend(user_id)
+                self.add_friend(FriendInfo(user_id=user_id, user_name=new_friends[user_id]))
+        await self._update_snapshot("friends", new_friends)
+
+    async def _get_snapshot(self):
+        if self._snapshot is None:
+            loop = asyncio.get_running_loop()
+            self._snapshot = await loop.run_in_executor(None, self._snapshot_store.load, self._steam_id)
+        return self._snapshot
+
+    async def _update_snapshot(self, key, value):
+        steam_id = self._steam_id
+        snapshot = await self._get_snapshot()
+        snapshot[key] = value
+        loop = asyncio.get_running_loop()
+        # saves run one at a time and copy snapshot only once previous one finished, so the latest state wins
+        async with self._snapshot_save_lock:
+            await loop.run_in_executor(None, self._snapshot_store.save, steam_id, dict(snapshot))
+
+    def _revalidate(self, key, refresh):
+        """Refresh snapshot entry in background, unless refresh is already running"""
+        task = self._revalidation_tasks.get(key)
+        if task is not None and not task.done():
+            return
+
+        async def run():
+            try:
+                await refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Failed to refresh %s", key)
+
+        self._revalidation_tasks[key] = asyncio.create_task(run())
+
+    def _cancel_revalidation(self):
+        tasks = list(self._revalidation_tasks.values())
+        self._revalidation_tasks = {}
+        for task in tasks:
+            task.cancel()
+        return tasks
 
-    def tick(self):
+    @staticmethod
+    async def _scan_local_games():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, local_games_list)
 
-        async def _update_local_games():
-            loop = asyncio.get_running_loop()
-            new_list = await loop.run_in_executor(None, local_games_list)
-            notify_list = get_state_changes(self._local_games_cache, new_list)
-            self._local_games_cache = new_list
-            for local_game_notify in notify_list:
-                self.update_local_game_status(local_game_notify)
+    def _update_local_games(self, new_list):
+        notify_list = get_state_changes(self._local_games_cache, new_list)
+        self._local_games_cache = new_list
+        for local_game_notify in notify_list:
+            self.update_local_game_status(local_game_notify)
 
+    def tick(self):
         if self._regmon.check_if_updated():
-            asyncio.create_task(_update_local_games())
+            self._local_games_scheduler.request()
 
     async def get_local_games(self):
         return self._local_games_cache
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import time
+
+
+class DiskResponseCache:
+    """Response bodies stored on disk, shared between plugin processes.
+
+    Entries are written to temporary file and moved in place, so concurrent readers see either old or new
+    complete body. Entries older than `max_age` seconds are ignored and evicted, oldest entries are evicted
+    when total size exceeds `max_size` bytes.
+    """
+
+    EVICTION_INTERVAL = 50
+
+    def __init__(self, directory, max_age=3600, max_size=64 * 2 ** 20):
+        self._directory = directory
+        self._max_age = max_age
+        self._max_size = max_size
+        self._writes_since_eviction = None
+
+    def _path(self, steam_id, url, params):
+        key = json.dumps([url, sorted((params or {}).items())], default=str)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._directory, str(steam_id), digest)
+
+    def get(self, steam_id, url, params=None, not_before=None):
+        """Get cached body, `not_before` rejects entries stored before given unix timestamp"""
+        path = self._path(steam_id, url, params)
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if time.time() - stat.st_mtime > self._max_age:
+                    return None
+                if not_before is not None and stat.st_mtime < not_before:
+                    return None
+                if stat.st_size == 0:
+                    return ""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                    return str(view, "utf-8", "replace")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logging.exception("Failed to read cached response")
+            return None
+
+    def put(self, steam_id, url, params, text):
+        path = self._path(steam_id, url, params)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(text.encode("utf-8"))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            # eg. file mapped by other process on Windows
+            logging.debug("Failed to cache response of %s", url, exc_info=True)
+            return
+
+        if self._writes_since_eviction is None or self._writes_since_eviction >= self.EVICTION_INTERVAL:
+            self.evict()
+        self._writes_since_eviction += 1
+
+    def evict(self):
+        self._writes_since_eviction = 0
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self._directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # leftovers of interrupted writes are removed as well once old enough
+                if now - stat.st_mtime > self._max_age:
+                    self._remove(path)
+                elif not name.endswith(".tmp"):
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+
+class CoalescingScheduler:
+    """Runs `scan` coroutine on request, with at most one scan in flight.
+
+    Requests are debounced on the trailing edge: a scan starts only after no new request came for `debounce`
+    seconds, but no later than `max_wait` seconds after the first one. Debounce has to be longer than the period
+    in which requests are made (eg. plugin tick) to merge anything. Requests made while a scan is running are
+    collapsed into a single follow-up scan. As scans run one after another in a single task, results are passed
+    to `apply` in the order scans were started.
+    """
+
+    def __init__(self, name, scan, apply, debounce=2.5, max_wait=10):
+        self._name = name
+        self._scan = scan
+        self._apply = apply
+        self._debounce = debounce
+        self._max_wait = max_wait
+        self._task = None
+        self._request_event = asyncio.Event()
+        self._scanning = False
+        self._rescan = False
+        # statistics
+        self.requested = 0
+        self.scans = 0
+        self.merged = 0
+        self.skipped = 0
+
+    def request(self):
+        self.requested += 1
+        if self._scanning:
+            if self._rescan:
+                self.skipped += 1
+            self._rescan = True
+            return
+
+        if self._task is not None and not self._task.done():
+            # still debouncing
+            self.merged += 1
+            self._request_event.set()
+            return
+
+        self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await self._wait_for_quiet()
+            self._rescan = False
+            self._scanning = True
+            try:
+                result = await self._scan()
+                self.scans += 1
+                self._apply(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Scan %s failed", self._name)
+            finally:
+                self._scanning = False
+
+            logging.debug(
+                "Scan %s: requested %d, scans %d, merged %d, skipped %d",
+                self._name, self.requested, self.scans, self.merged, self.skipped
+            )
+            if not self._rescan:
+                return
+
+    async def _wait_for_quiet(self):
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self._max_wait
+        while True:
+            self._request_event.clear()
+            timeout = min(self._debounce, give_up_at - loop.time())
+            if timeout <= 0:
+                # constant changes (eg. Steam downloading), do not postpone scan any longer
+                return
+            try:
+                await asyncio.wait_for(self._request_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return
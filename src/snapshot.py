@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+import platform
+import tempfile
+
+
+def default_snapshot_directory():
+    if platform.system().lower() == "windows":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+        return os.path.join(base, "GOG.com", "Galaxy", "plugins", "data", "steam")
+    return os.path.expanduser("~/Library/Application Support/GOG.com/Galaxy/plugins/data/steam")
+
+
+class SnapshotStore:
+    """Last known backend results persisted between plugin runs, one file per steam id"""
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def _path(self, steam_id):
+        return os.path.join(self._directory, "snapshot_{}.json".format(steam_id))
+
+    def load(self, steam_id):
+        try:
+            with open(self._path(steam_id), encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logging.exception("Failed to load snapshot")
+            return {}
+        if not isinstance(snapshot, dict):
+            return {}
+        return snapshot
+
+    def save(self, steam_id, snapshot):
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self._path(steam_id))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            logging.exception("Failed to save snapshot")
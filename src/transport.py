@@ -0,0 +1,120 @@
+import contextvars
+import logging
+import ssl
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import aiohttp
+import certifi
+
+try:
+    # brotlipy (requirements/app.txt), aiohttp decodes "br" responses only when it is installed
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+@dataclass
+class TransportConfig:
+    # total number of simultaneous connections
+    limit: int = 30
+    # same as galaxy.http default, plugin talks to steamcommunity.com only;
+    # also caps concurrent stats requests of achievements import
+    limit_per_host: int = 20
+    keepalive_timeout: float = 60
+    dns_cache_ttl: int = 300
+    # upper bound for whole request, requests made outside of import deadlines rely on it
+    total_timeout: float = 120
+    sock_read_timeout: float = 60
+    compression: bool = True
+
+
+STAT_NAMES = ("requests", "connections_created", "connections_reused", "dns_cache_hits", "dns_cache_misses")
+
+# counters of the innermost TransportStats.report block, inherited by tasks created in it
+_scope_counters = contextvars.ContextVar("transport_scope_counters", default=None)
+
+
+class TransportStats:
+    """Connection usage of a session.
+
+    Totals cover every request of the session. Counters logged by `report` cover only requests made from
+    the block (and tasks it spawned), so concurrent imports and background refreshes are not mixed up.
+    """
+
+    def __init__(self):
+        self._counters = Counter()
+
+    def trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._counting("requests"))
+        trace_config.on_connection_create_end.append(self._counting("connections_created"))
+        trace_config.on_connection_reuseconn.append(self._counting("connections_reused"))
+        trace_config.on_dns_cache_hit.append(self._counting("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(self._counting("dns_cache_misses"))
+        return trace_config
+
+    def as_dict(self):
+        return {name: self._counters[name] for name in STAT_NAMES}
+
+    @contextmanager
+    def report(self, name):
+        """Log transport statistics of requests made in the block"""
+        counters = Counter()
+        token = _scope_counters.set(counters)
+        try:
+            yield
+        finally:
+            _scope_counters.reset(token)
+            logging.info(
+                "%s transport: %d requests, %d new connections, %d reused, dns cache %d hits / %d misses",
+                name, *(counters[stat_name] for stat_name in STAT_NAMES)
+            )
+
+    def _counting(self, stat_name):
+        async def count(session, context, params):
+            self._counters[stat_name] += 1
+            scope_counters = _scope_counters.get()
+            if scope_counters is not None:
+                scope_counters[stat_name] += 1
+        return count
+
+
+class RequestProgress:
+    """Passed as `trace_request_ctx`, tells whether any attempt of the request got a connection"""
+
+    def __init__(self):
+        self.connected = False
+
+
+def _progress_trace_config():
+    async def on_connected(session, context, params):
+        if isinstance(context.trace_request_ctx, RequestProgress):
+            context.trace_request_ctx.connected = True
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connected)
+    trace_config.on_connection_reuseconn.append(on_connected)
+    return trace_config
+
+
+def create_session(config, stats, cookie_jar=None):
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    connector = aiohttp.TCPConnector(
+        limit=config.limit,
+        limit_per_host=config.limit_per_host,
+        keepalive_timeout=config.keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=config.dns_cache_ttl,
+        ssl=ssl_context
+    )
+    headers = {"Accept-Encoding": ACCEPT_ENCODING if config.compression else "identity"}
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=config.total_timeout, sock_read=config.sock_read_timeout),
+        cookie_jar=cookie_jar,
+        headers=headers,
+        trace_configs=[stats.trace_config(), _progress_trace_config()]
+    )